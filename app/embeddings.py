@@ -44,7 +44,7 @@ def generate_embedding(text: str, title: Optional[str] = None) -> np.array: # ty
     embeddings = model.encode(chunks)
     mean_embedding = np.mean(embeddings, axis=0)
     embedding = mean_embedding / np.linalg.norm(mean_embedding)
-    return embedding
+    return np.ascontiguousarray(embedding, dtype=np.float32)
 
 
 def sort_by_distance(embedding, objects: list):
@@ -56,17 +56,17 @@ def sort_by_distance(embedding, objects: list):
     return [o for o, d in sorted_objects]
 
 
-def get_similar_tags(model: Union[EmbeddableModel, Query], user: User, limit: Optional[int] = None) -> models.QuerySet:
+def get_similar_tags(model: Union[EmbeddableModel, Query], user: User, limit: Optional[int] = None, request=None) -> models.QuerySet:
     if isinstance(model, TaggableModel):
         exclude_filter = Q(pk__in=model.tags.all())
     elif isinstance(model, Tag):
         exclude_filter = Q(pk=model.pk)
     else:
         exclude_filter = None
-    return Tag.get_similar_objects(model.embedding, user, exclude_filter, limit)
+    return Tag.get_similar_objects(model.embedding, user, exclude_filter, limit, request=request)
 
 
-def get_similar_nodes(model: Union[EmbeddableModel, Query], node_class: type[NodeModel], user: User, limit: Optional[int], privacy_level: str = 'own'):
+def get_similar_nodes(model: Union[EmbeddableModel, Query], node_class: type[NodeModel], user: User, limit: Optional[int], privacy_level: str = 'own', request=None):
     if isinstance(model, Tag):
         exclude_filter = Q(tags=model) if issubclass(node_class, TaggableModel) else None
     elif isinstance(model, NodeModel):
@@ -75,5 +75,5 @@ def get_similar_nodes(model: Union[EmbeddableModel, Query], node_class: type[Nod
         exclude_filter = None
     else:
         raise NotImplementedError()
-    return node_class.get_similar_objects(model.embedding, user, exclude_filter, limit, privacy_level=privacy_level)
+    return node_class.get_similar_objects(model.embedding, user, exclude_filter, limit, privacy_level=privacy_level, request=request)
 
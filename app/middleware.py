@@ -0,0 +1,11 @@
+class VisiblePksCacheMiddleware:
+    """
+    Give each request an empty cache for PrivacySettingsModel.visible_pks, so privacy
+    filters are evaluated once per request rather than once per query that needs them.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.visible_pks_cache = dict()
+        return self.get_response(request)
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2023-10-20 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_user_friends_user_intention_user_intention_embedding_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['source_content_type', 'source_object_id'], name='link_src_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['target_content_type', 'target_object_id'], name='link_tgt_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.5 on 2023-10-20 18:31
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+from django.db import migrations
+import django.db.models.functions.comparison
+import pgvector.django
+
+
+EMBEDDING_TABLES = ['app_memo', 'app_reference', 'app_inkling', 'app_link', 'app_tag']
+
+
+class Migration(migrations.Migration):
+    # Building the indexes concurrently keeps the tables writable, which needs autocommit
+    atomic = False
+
+    dependencies = [
+        ('app', '0004_link_link_src_idx_link_link_tgt_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [f'UPDATE {table} SET embedding = l2_normalize(embedding) WHERE embedding IS NOT NULL;' for table in EMBEDDING_TABLES],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='memo',
+            index=pgvector.django.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('embedding', output_field=pgvector.django.HalfVectorField(dimensions=384)), name='halfvec_ip_ops'), ef_construction=64, m=16, name='memo_halfvec_hnsw'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='reference',
+            index=pgvector.django.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('embedding', output_field=pgvector.django.HalfVectorField(dimensions=384)), name='halfvec_ip_ops'), ef_construction=64, m=16, name='reference_halfvec_hnsw'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='inkling',
+            index=pgvector.django.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('embedding', output_field=pgvector.django.HalfVectorField(dimensions=384)), name='halfvec_ip_ops'), ef_construction=64, m=16, name='inkling_halfvec_hnsw'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='tag',
+            index=pgvector.django.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('embedding', output_field=pgvector.django.HalfVectorField(dimensions=384)), name='halfvec_ip_ops'), ef_construction=64, m=16, name='tag_halfvec_hnsw'),
+        ),
+    ]
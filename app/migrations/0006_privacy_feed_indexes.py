@@ -0,0 +1,29 @@
+# Generated by Django 4.2.5 on 2023-10-23 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_halfvec_hnsw_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='memo',
+            index=models.Index(fields=['user', 'privacy_setting', '-created_at'], name='memo_privfeed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reference',
+            index=models.Index(fields=['user', 'privacy_setting', '-created_at'], name='reference_privfeed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inkling',
+            index=models.Index(fields=['user', 'privacy_setting', '-created_at'], name='inkling_privfeed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['user', 'privacy_setting', '-created_at'], name='link_privfeed_idx'),
+        ),
+    ]
@@ -64,7 +64,7 @@ class UserScopedMixin:
 class PrivacyScopedMixin:
     def get_queryset(self):
         if issubclass(self.model, PrivacySettingsModel): # type: ignore
-            filter = self.model.get_privacy_filter(self.request.user, 'fof') # type: ignore
+            filter = self.model.get_privacy_filter(self.request.user, 'fof', self.request) # type: ignore
         else:
             filter = Q(user=self.request.user) # type: ignore
         return self.model.objects.filter(filter) # type: ignore
@@ -74,6 +74,6 @@ class LinkedContentMixin:
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs) # type: ignore
         if isinstance(self.object, NodeModel): # type: ignore
-            context['linked_content'] = self.object.get_link_groups(self.request.user) # type: ignore
+            context['linked_content'] = self.object.get_link_groups(self.request.user, self.request) # type: ignore
         return context
     
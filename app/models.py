@@ -1,18 +1,33 @@
 import uuid
 from collections import defaultdict
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Optional
 
 import numpy as np
+from django.apps import apps
 from django.contrib.auth.models import AbstractUser
 from django.contrib.contenttypes.fields import (GenericForeignKey,
                                                 GenericRelation)
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import OpClass
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Cast
 from django.urls import reverse
 from martor.models import MartorField
-from pgvector.django import CosineDistance, VectorField
+from pgvector.django import (HalfVectorField, HnswIndex, MaxInnerProduct,
+                             VectorField)
+
+
+# Above this many friends, the friends-of-friends privacy filter resolves friends of friends up front
+FOF_BOTTOM_UP_MIN_FRIENDS = 500
+
+# Up to this many visible objects, similarity search ranks them exactly instead of using the HNSW index
+EXACT_SEARCH_MAX_CANDIDATES = 2000
+
+# Above this many cached viewable nodes per model, Link.get_privacy_filter uses a subquery instead of an IN list
+LINK_PRIVACY_MAX_INLINE_IDS = 1000
 
 
 class TimeStampedModel(models.Model):
@@ -41,15 +56,29 @@ class User(AbstractUser, TimeStampedModel):
             self.friends.add(sender)
             sender.friends.add(self)
             FriendRequest.objects.filter(sender=sender, receiver=self).delete()
+            self._clear_friend_ids()
+            sender._clear_friend_ids()
 
     def reject_friend_request(self, sender: 'User'):
         FriendRequest.objects.filter(sender=sender, receiver=self).delete()
 
     def remove_friend(self, friend: 'User'):
         self.friends.remove(friend)
+        self._clear_friend_ids()
+        friend._clear_friend_ids()
+
+    @cached_property
+    def friend_ids(self) -> frozenset[int]:
+        """
+        The pks of this user's friends, fetched once per instance.
+        """
+        return frozenset(self.friends.values_list('pk', flat=True))
+
+    def _clear_friend_ids(self):
+        self.__dict__.pop('friend_ids', None)
 
     def is_friends_with(self, friend: 'User'):
-        return friend in self.friends.all()
+        return friend.pk in self.friend_ids
 
     def has_sent_request_to(self, receiver: 'User'):
         return FriendRequest.objects.filter(sender=self, receiver=receiver).exists()
@@ -92,39 +121,29 @@ class PrivacySettingsModel(UserOwnedModel):
 
     class Meta:
         abstract = True
+        # Concrete subclasses declare their own Meta, so they must list these indexes explicitly
+        indexes = [
+            models.Index(fields=['user', 'privacy_setting', '-created_at'], name='%(class)s_privfeed_idx'),
+        ]
 
 
-    def is_viewable_by(self, user):
+    def is_viewable_by(self, user, privacy_level: str = 'fof') -> bool:
         """
         Determine if a model instance is viewable by the given user based on privacy settings.
         """
         # If the object belongs to the user, they can always view it
-        if self.user == user:
+        if self.user_id == user.pk: # type: ignore
             return True
+        model = type(self)
+        return model.filter_viewable(model.objects.filter(pk=self.pk), user, privacy_level).exists() # type: ignore
 
-        # If privacy is set to private, only the owner can view
-        if self.privacy_setting == self.PRIVATE:
-            return False
-
-        # If privacy is set to friends, check if the given user is a friend of the owner
-        if self.privacy_setting == self.FRIENDS:
-            return user.is_friends_with(self.user) # type: ignore
-
-        # If privacy is set to friends of friends, check the relationship accordingly
-        if self.privacy_setting == self.FRIENDS_OF_FRIENDS:
-            # Direct friends
-            if user.is_friends_with(self.user):  # type: ignore
-                return True
-            
-            # Friends of friends
-            user_friends = user.friends.all()
-            owner_friends = self.user.friends.all() # type: ignore
-            
-            # Intersection checks for mutual friends
-            mutual_friends = set(user_friends).intersection(owner_friends)
-            return bool(mutual_friends)
-
-        return False
+    @classmethod
+    def filter_viewable(cls, queryset: models.QuerySet, user, level) -> models.QuerySet:
+        """
+        Restrict a queryset to the objects the user can see at the given level,
+        so lists are filtered in one query rather than checked object by object.
+        """
+        return queryset.filter(cls.get_privacy_filter(user, level))
 
 
     @classmethod
@@ -146,16 +165,24 @@ class PrivacySettingsModel(UserOwnedModel):
         """
         Return a Q object representing objects owned by the friends of friends of the given user.
         """
-        user_friends = user.friends.all()
-        return Q(privacy_setting=cls.FRIENDS_OF_FRIENDS, user__friends__in=user_friends) & ~Q(user__in=user_friends)
+        friend_ids = list(user.friend_ids)
+        if len(friend_ids) > FOF_BOTTOM_UP_MIN_FRIENDS:
+            # For users with many friends, filter on owner id against a friends-of-friends subquery
+            # built from the friendship table, rather than inlining the large friend list in a join
+            fof_ids = (User.objects.filter(friends__friends=user)
+                       .exclude(friends=user).exclude(pk=user.pk)
+                       .values('pk'))
+            return Q(privacy_setting=cls.FRIENDS_OF_FRIENDS, user_id__in=fof_ids)
+        return Q(privacy_setting=cls.FRIENDS_OF_FRIENDS, user__friends__in=friend_ids) & ~Q(user_id__in=friend_ids) & ~Q(user=user)
 
     @classmethod
-    def get_privacy_filter(cls, user, level) -> Q:
+    def get_privacy_filter(cls, user, level, request=None) -> Q:
         """
         Return a combined Q object based on the level:
         - 'own': Just the user's objects.
         - 'friends': User's and friends' objects.
         - 'fof': User's, friends', and friends of friends' objects.
+        The request is only used by models whose filters can reuse per-request caches, like Link.
         """
         if level == 'own':
             return cls._get_own_objects_filter(user)
@@ -166,6 +193,27 @@ class PrivacySettingsModel(UserOwnedModel):
         else:
             raise ValueError("Invalid level provided.")
 
+    @classmethod
+    def visible_pks(cls, user, level, request=None, limit: Optional[int] = None) -> frozenset[int]:
+        """
+        Return the pks of the objects the user can see at the given level. With a limit, a result
+        holding at least limit pks may be incomplete, so callers can cap the fetch and check its size.
+        When a request is given, the result is cached on it for the rest of the request.
+        """
+        cache = getattr(request, 'visible_pks_cache', None)
+        key = (cls._meta.label, user.pk, level)
+        if cache is not None and key in cache:
+            pks, complete = cache[key]
+            if complete or (limit is not None and len(pks) >= limit):
+                return pks
+        # The friends joins can repeat a row, so only distinct pks count towards the limit
+        queryset = (cls.objects.filter(cls.get_privacy_filter(user, level, request))
+                    .order_by().distinct().values_list('pk', flat=True))
+        pks = frozenset(queryset if limit is None else queryset[:limit])
+        if cache is not None:
+            cache[key] = (pks, limit is None or len(pks) < limit)
+        return pks
+
 
 
 class TitleAndContentModel(models.Model):
@@ -196,34 +244,74 @@ class LinkType(UserOwnedModel, TimeStampedModel):
         return reverse('link_types')
 
 
+def normalize_embedding(embedding) -> np.ndarray:
+    """
+    Scale an embedding to unit length, so inner product ranks the same as cosine similarity.
+    """
+    embedding = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm > 0 else embedding
+
+
+def half_precision_embedding() -> Cast:
+    """
+    The embedding column cast to halfvec, which is what the HNSW indexes are built on.
+    """
+    return Cast('embedding', HalfVectorField(dimensions=384))
+
+
 class EmbeddableModel(models.Model):
     embedding = VectorField(dimensions=384, null=True)
 
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        if 'embedding' not in self.get_deferred_fields() and self.embedding is not None:
+            self.embedding = normalize_embedding(self.embedding)
+        super().save(*args, **kwargs)
+
     @classmethod
     def get_similar_objects(cls, embedding, user: User, 
                             exclude_filter: Optional[Q] = None,
                             limit: Optional[int] = None,
                             distance_threshold: float = 0.6,
-                            privacy_level: str = 'own') -> models.QuerySet:
+                            privacy_level: str = 'own',
+                            request=None,
+                            include_embedding: bool = False) -> models.QuerySet:
 
-        queryset = (cls.objects
-                    .alias(distance=CosineDistance('embedding', embedding))
-                    .filter(distance__lt=distance_threshold)
-                    .order_by('distance'))
-    
         if issubclass(cls, PrivacySettingsModel):
-            privacy_filter = cls.get_privacy_filter(user, privacy_level)
+            privacy_filter = cls.get_privacy_filter(user, privacy_level, request)
         else:
             privacy_filter = Q(user=user)
-        queryset = queryset.filter(privacy_filter)
 
-        
+        # When few objects are visible, rank them exactly by pk rather than walking the HNSW index
+        # over every row and discarding the ones the user cannot see. Larger sets rely on the
+        # hnsw.iterative_scan connection option to keep scanning until enough visible rows are found
+        if request is not None and issubclass(cls, PrivacySettingsModel):
+            candidate_pks = cls.visible_pks(user, privacy_level, request, limit=EXACT_SEARCH_MAX_CANDIDATES + 1)
+        else:
+            candidate_pks = list(cls.objects.filter(privacy_filter).order_by().distinct()
+                                 .values_list('pk', flat=True)[:EXACT_SEARCH_MAX_CANDIDATES + 1])
+        if len(candidate_pks) <= EXACT_SEARCH_MAX_CANDIDATES:
+            privacy_filter = Q(pk__in=candidate_pks)
+            distance = MaxInnerProduct('embedding', embedding)
+        else:
+            # Must match the indexed expression for the half precision HNSW index to be used
+            distance = MaxInnerProduct(half_precision_embedding(), embedding)
+
+        queryset = cls.objects.filter(privacy_filter).select_related('user')
         if exclude_filter is not None:
             queryset = queryset.exclude(exclude_filter)
-            
+
+        # Embeddings are unit length, so the negative inner product is the cosine distance minus one
+        queryset = (queryset
+                    .annotate(distance=distance)
+                    .filter(distance__lt=distance_threshold - 1)
+                    .order_by('distance'))
+        if not include_embedding:
+            queryset = queryset.defer('embedding')
+
         if limit:
             queryset = queryset[:limit]
             
@@ -234,12 +322,20 @@ class TaggableModel(UserOwnedModel):
     tags = models.ManyToManyField('Tag', blank=True)
 
     def create_tags(self, tags: list[str]):
+        # bulk_create skips Tag.save and the post_save embedding signal, so normalize and embed here
+        from .embeddings import generate_embedding
+
+        names = {tag_name.lower().strip() for tag_name in tags} - {''}
+        if not names:
+            return
+        user = self.user
+        # Embed outside the transaction so it is not held open during inference;
+        # tags created concurrently in the meantime are skipped by ignore_conflicts
+        existing_names = set(Tag.objects.filter(user=user, name__in=names).values_list('name', flat=True))
+        new_tags = [Tag(name=name, user=user, embedding=generate_embedding(name)) for name in names - existing_names]
         with transaction.atomic():
-            tag_objects = [
-                Tag.objects.get_or_create(name=tag_name.lower(), user=self.user)[0] 
-                for tag_name in tags
-            ]            
-            self.tags.add(*tag_objects)
+            Tag.objects.bulk_create(new_tags, ignore_conflicts=True)
+            self.tags.add(*Tag.objects.filter(user=user, name__in=names))
 
     class Meta:
         abstract = True
@@ -255,33 +351,61 @@ class NodeModel(EmbeddableModel, TaggableModel, PrivacySettingsModel, TimeStampe
     class Meta:
         abstract = True
 
-    def all_links(self, user: Optional[User] = None):
+    def _outgoing_and_incoming_links(self, user: Optional[User] = None, request=None) -> tuple[models.QuerySet, models.QuerySet]:
+        """
+        Return the links leaving and entering this node as two querysets, each of which
+        can be answered from one of Link's per-side indexes. Self-links only count as outgoing.
+        """
         content_type = ContentType.objects.get_for_model(self)
         user = self.user if user is None else user
-        privacy_filter = Link.get_privacy_filter(user, 'fof')
-        links = Link.objects.filter(
-            models.Q(source_content_type=content_type, source_object_id=self.pk) |
-            models.Q(target_content_type=content_type, target_object_id=self.pk)
-        ).select_related('link_type')
-        print(links.all())
-        return links.filter(privacy_filter)
-
-    def all_linked_objects(self, user: Optional[User] = None) -> list['NodeModel']:
-        objects = []
-        for link in self.all_links(user=user):
-            if link.target_content_object == self:
-                objects.append(link.source_content_object)
-            else:
-                objects.append(link.target_content_object)
+        links = Link.objects.filter(Link.get_privacy_filter(user, 'fof', request))
+        outgoing = links.filter(source_content_type=content_type, source_object_id=self.pk)
+        incoming = (links.filter(target_content_type=content_type, target_object_id=self.pk)
+                    .exclude(source_content_type=content_type, source_object_id=self.pk))
+        return outgoing, incoming
+
+    def _link_ends(self, user: Optional[User] = None, request=None) -> list[tuple[int, str, tuple[int, int]]]:
+        """
+        Return (link_type_id, direction, (content_type_id, object_id)) for each link of this node,
+        where the key identifies the node on the other end.
+        """
+        outgoing, incoming = self._outgoing_and_incoming_links(user, request)
+        fields = ['link_type_id', 'source_content_type_id', 'source_object_id', 'target_content_type_id', 'target_object_id']
+        link_ends = []
+        for row in outgoing.values(*fields):
+            link_ends.append((row['link_type_id'], "outgoing", (row['target_content_type_id'], row['target_object_id'])))
+        for row in incoming.values(*fields):
+            link_ends.append((row['link_type_id'], "incoming", (row['source_content_type_id'], row['source_object_id'])))
+        return link_ends
+
+    def _load_nodes(self, keys: list[tuple[int, int]]) -> dict[tuple[int, int], 'NodeModel']:
+        """
+        Load the nodes identified by (content_type_id, object_id) keys with one query per content type.
+        """
+        content_type = ContentType.objects.get_for_model(self)
+        objects = {(content_type.id, self.pk): self}
+        ids_by_content_type_id = defaultdict(set)
+        for content_type_id, object_id in keys:
+            if (content_type_id, object_id) not in objects:
+                ids_by_content_type_id[content_type_id].add(object_id)
+        for content_type_id, ids in ids_by_content_type_id.items():
+            model_class = ContentType.objects.get_for_id(content_type_id).model_class()
+            for pk, obj in model_class._default_manager.select_related('user').in_bulk(ids).items(): # type: ignore
+                objects[(content_type_id, pk)] = obj
         return objects
 
-    def get_link_groups(self, user: Optional[User] = None) -> dict[tuple[LinkType, str], list['NodeModel']]:
+    def all_linked_objects(self, user: Optional[User] = None, request=None) -> list['NodeModel']:
+        link_ends = self._link_ends(user, request)
+        linked = self._load_nodes([key for _, _, key in link_ends])
+        return [linked.get(key) for _, _, key in link_ends] # type: ignore
+
+    def get_link_groups(self, user: Optional[User] = None, request=None) -> dict[tuple[LinkType, str], list['NodeModel']]:
+        link_ends = self._link_ends(user, request)
+        linked = self._load_nodes([key for _, _, key in link_ends])
+        link_types = LinkType.objects.in_bulk({link_type_id for link_type_id, _, _ in link_ends})
         link_groups = defaultdict(list)
-        for link in self.all_links(user):
-            direction = "outgoing" if link.source_content_object == self else "incoming"
-            key = (link.link_type, direction)
-            target = link.target_content_object if direction == "outgoing" else link.source_content_object
-            link_groups[key].append(target)
+        for link_type_id, direction, key in link_ends:
+            link_groups[(link_types[link_type_id], direction)].append(linked.get(key))
         return dict(link_groups)
 
     def related_nodes_filter(self, other_model_class: type['NodeModel']) -> Q:
@@ -320,6 +444,11 @@ class Link(NodeModel, PrivacySettingsModel):
     class Meta:
         unique_together = ['source_content_type', 'source_object_id', 'target_content_type', 'target_object_id', 'link_type']
         ordering = ['link_type']
+        indexes = [
+            *PrivacySettingsModel.Meta.indexes,
+            models.Index(fields=['source_content_type', 'source_object_id'], name='link_src_idx'),
+            models.Index(fields=['target_content_type', 'target_object_id'], name='link_tgt_idx'),
+        ]
 
     def related_nodes_filter(self, other_model_class: type[NodeModel]) -> Q:
         exclude_conditions = super().related_nodes_filter(other_model_class)
@@ -340,25 +469,34 @@ class Link(NodeModel, PrivacySettingsModel):
         return self.source_content_object.is_viewable_by(user, privacy_level) and self.target_content_object.is_viewable_by(user, privacy_level) # type: ignore
 
     @classmethod
-    def get_privacy_filter(cls, user: User, privacy_level: str = 'fof') -> Q:
+    def get_privacy_filter(cls, user: User, privacy_level: str = 'fof', request=None) -> Q:
         """
         Returns a QuerySet of Link objects that are viewable by the specified user.
         A Link is viewable if both its source and target nodes are viewable by the user.
         """
 
-        # Get content types for all NodeModels
-        node_content_types = ContentType.objects.filter(app_label='app', model__in=['memo', 'reference', 'inkling'])
-
-        # Generate Q objects for each content type based on viewability
-        combined_filters = Q()
-        for content_type in node_content_types:
-            node_model = content_type.model_class()
+        # Generate Q objects for each content type based on viewability, per end so that
+        # links between two node types match as well
+        source_filters = Q()
+        target_filters = Q()
+        for content_type, node_model in _node_content_types():
             if issubclass(node_model, PrivacySettingsModel): # type: ignore
                 model_filter = node_model.get_privacy_filter(user, privacy_level)
-                combined_filters |= Q(source_content_type=content_type, source_object_id__in=node_model.objects.filter(model_filter)) & \
-                                    Q(target_content_type=content_type, target_object_id__in=node_model.objects.filter(model_filter))
+                # Inline the viewable ids only with a request, which caches the capped fetch for its
+                # remaining queries; without one, building the filter costs no queries of its own
+                viewable_ids = None
+                if request is not None:
+                    viewable_ids = node_model.visible_pks(user, privacy_level, request, limit=LINK_PRIVACY_MAX_INLINE_IDS + 1)
+                if viewable_ids is not None and len(viewable_ids) <= LINK_PRIVACY_MAX_INLINE_IDS:
+                    source_filters |= Q(source_content_type_id=content_type.id, source_object_id__in=viewable_ids)
+                    target_filters |= Q(target_content_type_id=content_type.id, target_object_id__in=viewable_ids)
+                else:
+                    # Probe the node table by pk with correlated EXISTS subqueries
+                    viewable_nodes = node_model.objects.filter(model_filter)
+                    source_filters |= Q(Exists(viewable_nodes.filter(pk=OuterRef('source_object_id'))), source_content_type_id=content_type.id)
+                    target_filters |= Q(Exists(viewable_nodes.filter(pk=OuterRef('target_object_id'))), target_content_type_id=content_type.id)
         
-        return combined_filters
+        return source_filters & target_filters
 
 
 
@@ -366,6 +504,10 @@ class Link(NodeModel, PrivacySettingsModel):
 class Memo(TitleAndContentModel, NodeModel, SummarizableModel, PrivacySettingsModel):
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            *PrivacySettingsModel.Meta.indexes,
+            HnswIndex(OpClass(half_precision_embedding(), name='halfvec_ip_ops'), name='memo_halfvec_hnsw', m=16, ef_construction=64),
+        ]
 
     @classmethod
     def get_list_url(cls):
@@ -383,6 +525,10 @@ class Reference(TitleAndContentModel, NodeModel, SummarizableModel, PrivacySetti
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            *PrivacySettingsModel.Meta.indexes,
+            HnswIndex(OpClass(half_precision_embedding(), name='halfvec_ip_ops'), name='reference_halfvec_hnsw', m=16, ef_construction=64),
+        ]
 
     def get_absolute_url(self):
         return reverse('reference_view', args=[str(self.pk)])
@@ -395,6 +541,10 @@ class Reference(TitleAndContentModel, NodeModel, SummarizableModel, PrivacySetti
 class Inkling(TitleAndContentModel, NodeModel, PrivacySettingsModel):
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            *PrivacySettingsModel.Meta.indexes,
+            HnswIndex(OpClass(half_precision_embedding(), name='halfvec_ip_ops'), name='inkling_halfvec_hnsw', m=16, ef_construction=64),
+        ]
     
     def get_absolute_url(self):
         return reverse('inkling_view', args=[str(self.pk)])
@@ -414,6 +564,9 @@ class Tag(EmbeddableModel, UserOwnedModel, TimeStampedModel):
     class Meta:
         unique_together = ['user', 'name']
         ordering = ['name']
+        indexes = [
+            HnswIndex(OpClass(half_precision_embedding(), name='halfvec_ip_ops'), name='tag_halfvec_hnsw', m=16, ef_construction=64),
+        ]
 
     def __str__(self):
         return self.name
@@ -430,11 +583,36 @@ class Tag(EmbeddableModel, UserOwnedModel, TimeStampedModel):
         return reverse('tags')
 
 
+# Content types of the node models that links can connect, filled on first use
+NODE_MODEL_NAMES = ('memo', 'reference', 'inkling')
+_NODE_CONTENT_TYPES: Optional[tuple[tuple[ContentType, type[NodeModel]], ...]] = None
+
+
+def _node_content_types() -> tuple[tuple[ContentType, type[NodeModel]], ...]:
+    """
+    Return (content_type, model_class) pairs for the node models that links can connect.
+    Computed once per process, as content types do not change at runtime.
+    """
+    global _NODE_CONTENT_TYPES
+    if _NODE_CONTENT_TYPES is None:
+        apps.check_models_ready()
+        node_content_types = []
+        for model_name in NODE_MODEL_NAMES:
+            model_class = apps.get_model('app', model_name)
+            node_content_types.append((ContentType.objects.get_for_model(model_class), model_class))
+        # Assigned in one step, so concurrent first calls can only ever replace it with an equal tuple
+        _NODE_CONTENT_TYPES = tuple(node_content_types)
+    return _NODE_CONTENT_TYPES
+
+
 @dataclass
 class Query:
     query: str
     embedding: np.ndarray
 
+    def __post_init__(self):
+        self.embedding = np.ascontiguousarray(normalize_embedding(self.embedding))
+
 
 class UserInvite(TimeStampedModel):
     # Status Choices
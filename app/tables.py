@@ -57,7 +57,8 @@ class BaseNodeTable(EditableMixin, tables.Table):
         return mark_safe(", ".join(link_to_object_html(tag) for tag in value.all()))
 
     def render_links(self, record):
-        return mark_safe(", ".join(link_to_object_html(other) for other in record.all_linked_objects()))
+        linked_objects = record.all_linked_objects(request=self.context['request']) # type: ignore
+        return mark_safe(", ".join(link_to_object_html(other) for other in linked_objects))
 
 
 class ReferenceTable(BaseNodeTable):
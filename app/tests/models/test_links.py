@@ -0,0 +1,86 @@
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from app.models import Inkling, Link, LinkType, Memo, PrivacySettingsModel, User
+
+
+class LinkedObjectsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password='testpass')
+        stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='testpass')
+        embedding = np.ones(384, dtype=np.float32)
+        cls.supports = LinkType.objects.create(user=cls.owner, name='supports', reverse_name='supported by')
+        cls.contradicts = LinkType.objects.create(user=cls.owner, name='contradicts', reverse_name='contradicted by')
+
+        cls.memo = Memo.objects.create(user=cls.owner, title='Memo', content='', embedding=embedding)
+        cls.other_memo = Memo.objects.create(user=cls.owner, title='Other memo', content='', embedding=embedding)
+        cls.inkling = Inkling.objects.create(user=cls.owner, title='Inkling', content='', embedding=embedding)
+        private_memo = Memo.objects.create(user=stranger, title='Private memo', content='',
+                                           privacy_setting=PrivacySettingsModel.PRIVATE, embedding=embedding)
+
+        for link_type, source, target in [
+            (cls.supports, cls.memo, cls.other_memo),
+            (cls.supports, cls.memo, cls.memo),
+            (cls.contradicts, cls.inkling, cls.memo),
+            # Hidden from the owner, who cannot see the stranger's private memo
+            (cls.supports, cls.memo, private_memo),
+        ]:
+            Link.objects.create(user=cls.owner, link_type=link_type, source_content_object=source,
+                                target_content_object=target, embedding=embedding)
+
+    def setUp(self):
+        # Also fills the content type cache that _load_nodes reads from
+        self.memo_content_type_id = ContentType.objects.get_for_model(Memo).id
+        self.inkling_content_type_id = ContentType.objects.get_for_model(Inkling).id
+
+    def test_link_ends(self):
+        self.assertCountEqual(self.memo._link_ends(), [
+            (self.supports.id, 'outgoing', (self.memo_content_type_id, self.other_memo.pk)),
+            (self.supports.id, 'outgoing', (self.memo_content_type_id, self.memo.pk)),
+            (self.contradicts.id, 'incoming', (self.inkling_content_type_id, self.inkling.pk)),
+        ])
+
+    def test_link_ends_from_other_nodes(self):
+        self.assertEqual(self.other_memo._link_ends(), [
+            (self.supports.id, 'incoming', (self.memo_content_type_id, self.memo.pk)),
+        ])
+        self.assertEqual(self.inkling._link_ends(), [
+            (self.contradicts.id, 'outgoing', (self.memo_content_type_id, self.memo.pk)),
+        ])
+
+    def test_self_link_is_only_outgoing(self):
+        outgoing, incoming = self.memo._outgoing_and_incoming_links()
+        self.assertEqual(outgoing.filter(target_object_id=self.memo.pk).count(), 1)
+        self.assertFalse(incoming.filter(source_object_id=self.memo.pk).exists())
+
+    def test_load_nodes_queries_once_per_content_type(self):
+        keys = [
+            (self.memo_content_type_id, self.other_memo.pk),
+            (self.memo_content_type_id, self.memo.pk),
+            (self.inkling_content_type_id, self.inkling.pk),
+        ]
+        with self.assertNumQueries(2):
+            nodes = self.memo._load_nodes(keys)
+            self.assertEqual(nodes[keys[2]].user, self.owner)
+        self.assertIs(nodes[keys[1]], self.memo)
+        self.assertEqual(nodes[keys[0]], self.other_memo)
+        self.assertIsInstance(nodes[keys[2]], Inkling)
+
+    def test_all_linked_objects(self):
+        self.assertCountEqual(self.memo.all_linked_objects(), [self.other_memo, self.memo, self.inkling])
+
+    def test_get_link_groups(self):
+        link_groups = self.memo.get_link_groups()
+        self.assertEqual(set(link_groups), {(self.supports, 'outgoing'), (self.contradicts, 'incoming')})
+        self.assertCountEqual(link_groups[(self.supports, 'outgoing')], [self.other_memo, self.memo])
+        self.assertEqual(link_groups[(self.contradicts, 'incoming')], [self.inkling])
+        self.assertEqual({link_type.reverse_name for link_type, _ in link_groups}, {'supported by', 'contradicted by'})
+
+    def test_get_link_groups_query_count(self):
+        # Warm the friend ids and node content type caches, which are fetched once
+        self.memo.get_link_groups()
+        # Outgoing and incoming links, one bulk load per linked content type and the link types
+        with self.assertNumQueries(5):
+            self.memo.get_link_groups()
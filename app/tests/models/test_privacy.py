@@ -0,0 +1,138 @@
+from unittest.mock import patch
+
+import numpy as np
+from django.test import RequestFactory, TestCase
+
+from app.models import Link, LinkType, Memo, PrivacySettingsModel, User
+
+PRIVACY_SETTINGS = [PrivacySettingsModel.PRIVATE, PrivacySettingsModel.FRIENDS, PrivacySettingsModel.FRIENDS_OF_FRIENDS]
+LEVELS = ['own', 'friends', 'fof']
+
+
+def expected_settings(viewer_name: str, level: str) -> set[str]:
+    """
+    The privacy settings of the owner's objects that each viewer can see at each level.
+    """
+    if viewer_name == 'owner':
+        return set(PRIVACY_SETTINGS)
+    if viewer_name == 'friend' and level in ['friends', 'fof']:
+        return {PrivacySettingsModel.FRIENDS, PrivacySettingsModel.FRIENDS_OF_FRIENDS}
+    if viewer_name == 'friend_of_friend' and level == 'fof':
+        return {PrivacySettingsModel.FRIENDS_OF_FRIENDS}
+    return set()
+
+
+class PrivacyTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            name: User.objects.create_user(username=name, email=f'{name}@example.com', password='testpass')
+            for name in ['owner', 'friend', 'friend_of_friend', 'stranger']
+        }
+        owner = cls.users['owner']
+        owner.friends.add(cls.users['friend'])
+        cls.users['friend'].friends.add(cls.users['friend_of_friend'])
+
+        embedding = np.ones(384, dtype=np.float32)
+        link_type = LinkType.objects.create(user=owner, name='supports', reverse_name='supported by')
+        cls.memos = {}
+        cls.links = {}
+        for privacy_setting in PRIVACY_SETTINGS:
+            source, target = [
+                Memo.objects.create(user=owner, title=f'{privacy_setting} {i}', content='', privacy_setting=privacy_setting, embedding=embedding)
+                for i in range(2)
+            ]
+            cls.memos[privacy_setting] = [source, target]
+            cls.links[privacy_setting] = Link.objects.create(user=owner, link_type=link_type, source_content_object=source,
+                                                             target_content_object=target, embedding=embedding)
+
+    def viewers_and_levels(self) -> list[tuple[str, User, str]]:
+        return [(viewer_name, viewer, level) for viewer_name, viewer in self.users.items() for level in LEVELS]
+
+    def make_request(self):
+        request = RequestFactory().get('/')
+        request.visible_pks_cache = dict()
+        return request
+
+
+class IsViewableByTest(PrivacyTestCase):
+    def test_is_viewable_by(self):
+        for viewer_name, viewer, level in self.viewers_and_levels():
+            for privacy_setting, memos in self.memos.items():
+                with self.subTest(viewer=viewer_name, level=level, privacy_setting=privacy_setting):
+                    self.assertEqual(memos[0].is_viewable_by(viewer, level),
+                                     privacy_setting in expected_settings(viewer_name, level))
+
+    def test_filter_viewable(self):
+        for viewer_name, viewer, level in self.viewers_and_levels():
+            with self.subTest(viewer=viewer_name, level=level):
+                viewable = Memo.filter_viewable(Memo.objects.all(), viewer, level)
+                self.assertEqual({memo.privacy_setting for memo in viewable}, expected_settings(viewer_name, level))
+
+
+class VisiblePksTest(PrivacyTestCase):
+    def expected_pks(self, visible_settings):
+        return frozenset(memo.pk for privacy_setting in visible_settings for memo in self.memos[privacy_setting])
+
+    def test_visible_pks(self):
+        for viewer_name, viewer, level in self.viewers_and_levels():
+            with self.subTest(viewer=viewer_name, level=level):
+                self.assertEqual(Memo.visible_pks(viewer, level), self.expected_pks(expected_settings(viewer_name, level)))
+
+    def test_visible_pks_is_cached_on_request(self):
+        request = self.make_request()
+        owner = self.users['owner']
+        pks = Memo.visible_pks(owner, 'fof', request)
+        with self.assertNumQueries(0):
+            self.assertEqual(Memo.visible_pks(owner, 'fof', request), pks)
+
+    def test_limited_visible_pks_is_not_reused_for_larger_limits(self):
+        request = self.make_request()
+        owner = self.users['owner']
+        self.assertEqual(len(Memo.visible_pks(owner, 'fof', request, limit=2)), 2)
+        self.assertEqual(Memo.visible_pks(owner, 'fof', request), self.expected_pks(PRIVACY_SETTINGS))
+
+    def test_limited_visible_pks_counts_distinct_objects(self):
+        # With two friends, the friends joins return each of the owner's objects twice
+        owner = self.users['owner']
+        owner.friends.add(User.objects.create_user(username='second_friend', email='second_friend@example.com', password='testpass'))
+        request = self.make_request()
+        expected_pks = self.expected_pks(PRIVACY_SETTINGS)
+        self.assertEqual(Memo.visible_pks(owner, 'fof', request, limit=len(expected_pks)), expected_pks)
+        self.assertEqual(Memo.visible_pks(owner, 'fof', request), expected_pks)
+
+
+class FriendsOfFriendsFilterTest(PrivacyTestCase):
+    def test_bottom_up_filter_matches_join_filter(self):
+        for viewer_name, viewer in self.users.items():
+            with self.subTest(viewer=viewer_name):
+                join_pks = Memo.visible_pks(viewer, 'fof')
+                with patch('app.models.FOF_BOTTOM_UP_MIN_FRIENDS', 0):
+                    bottom_up_pks = Memo.visible_pks(viewer, 'fof')
+                self.assertEqual(bottom_up_pks, join_pks)
+
+
+class LinkPrivacyFilterTest(PrivacyTestCase):
+    def assert_visible_links(self, request_factory):
+        for viewer_name, viewer, level in self.viewers_and_levels():
+            with self.subTest(viewer=viewer_name, level=level):
+                links = Link.objects.filter(Link.get_privacy_filter(viewer, level, request_factory()))
+                expected_links = {self.links[privacy_setting] for privacy_setting in expected_settings(viewer_name, level)}
+                self.assertEqual(set(links), expected_links)
+
+    def test_link_privacy_filter_without_request(self):
+        self.assert_visible_links(lambda: None)
+
+    def test_link_privacy_filter_with_inlined_ids(self):
+        self.assert_visible_links(self.make_request)
+
+    def test_link_privacy_filter_with_exists_subqueries(self):
+        with patch('app.models.LINK_PRIVACY_MAX_INLINE_IDS', 0):
+            self.assert_visible_links(self.make_request)
+
+    def test_link_privacy_filter_without_request_runs_no_queries(self):
+        viewer = self.users['friend']
+        # Warm the friend ids and node content type caches, which are fetched once
+        Link.get_privacy_filter(viewer, 'fof')
+        with self.assertNumQueries(0):
+            Link.get_privacy_filter(viewer, 'fof')
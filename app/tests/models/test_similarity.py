@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+import numpy as np
+from django.db import connection
+from django.test import TestCase
+
+from app.models import Memo, User
+
+
+def unit_vector(*components: float) -> np.ndarray:
+    vector = np.zeros(384, dtype=np.float32)
+    vector[:len(components)] = components
+    return vector / np.linalg.norm(vector)
+
+
+class GetSimilarObjectsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username='viewer', email='viewer@example.com', password='testpass')
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass')
+        cls.query = unit_vector(1)
+        # Another user's private memos are the nearest neighbours of the query and fill the HNSW candidate list
+        Memo.objects.bulk_create([
+            Memo(user=other, title=f'Other {i}', content='', embedding=cls.query) for i in range(200)
+        ])
+        cls.visible = [
+            Memo.objects.create(user=cls.viewer, title=f'Mine {i}', content='', embedding=unit_vector(1, 0.1 * (i + 1)))
+            for i in range(3)
+        ]
+
+    def test_exact_search_returns_visible_objects(self):
+        results = list(Memo.get_similar_objects(self.query, self.viewer, limit=10))
+        self.assertEqual(results, self.visible)
+
+    def test_index_search_returns_visible_objects(self):
+        # A table this small would otherwise be scanned and sorted; with both ruled out for the
+        # test transaction, the HNSW index is the only way to return rows in distance order
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+        with patch('app.models.EXACT_SEARCH_MAX_CANDIDATES', 0):
+            queryset = Memo.get_similar_objects(self.query, self.viewer, limit=10)
+        self.assertIn('memo_halfvec_hnsw', queryset.explain())
+        self.assertEqual(list(queryset), self.visible)
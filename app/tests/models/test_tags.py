@@ -0,0 +1,28 @@
+from unittest.mock import patch
+
+import numpy as np
+from django.test import TestCase
+
+from app.models import Memo, Tag, User
+
+
+class CreateTagsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        embedding = np.ones(384, dtype=np.float32)
+        cls.memo = Memo.objects.create(user=cls.user, title='Memo', content='', embedding=embedding)
+        cls.existing_tag = Tag.objects.create(user=cls.user, name='python', embedding=embedding)
+
+    def test_create_tags_embeds_only_new_names(self):
+        with patch('app.embeddings.generate_embedding', return_value=np.ones(384, dtype=np.float32)) as generate_embedding:
+            self.memo.create_tags(['Python', ' Django ', 'django', ''])
+        generate_embedding.assert_called_once_with('django')
+        self.assertCountEqual(self.memo.tags.values_list('name', flat=True), ['python', 'django'])
+
+    def test_create_tags_reuses_existing_tags(self):
+        with patch('app.embeddings.generate_embedding') as generate_embedding:
+            self.memo.create_tags(['python', ' PYTHON '])
+        generate_embedding.assert_not_called()
+        self.assertEqual(list(self.memo.tags.all()), [self.existing_tag])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
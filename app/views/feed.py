@@ -18,13 +18,13 @@ class FeedContentMixin(LinkedContentMixin):
         user = self.request.user # type: ignore
         context['current_user'] = user
         context['hatch_inkling_form'] = InklingForm()
-        context['similar_tags'] = get_similar_tags(object, user, 10)
+        context['similar_tags'] = get_similar_tags(object, user, 10, request=self.request) # type: ignore
         for privacy_level in ['own', 'friends', 'fof']:
             feed_objects = []
             for search_class in [Reference, Inkling, Memo]:
-                similar_nodes = get_similar_nodes(object, search_class, user, 10, privacy_level=privacy_level)
+                similar_nodes = get_similar_nodes(object, search_class, user, 10, privacy_level=privacy_level, request=self.request) # type: ignore
                 feed_objects.extend(similar_nodes)
-            feed_objects = sort_by_distance(object.embedding, feed_objects)
+            feed_objects = sorted(feed_objects, key=lambda o: o.distance)
             context[f'feed_objects_{privacy_level}'] = feed_objects
         return context
 
@@ -78,7 +78,10 @@ def new_feed_view(request):
         feed_objects = []
 
         for search_class in [Memo, Reference, Link, Inkling]:
-            recent = search_class.objects.filter(search_class.get_privacy_filter(user, privacy_level)).order_by('-updated_at')[:20]
+            recent = (search_class.objects
+                      .filter(search_class.get_privacy_filter(user, privacy_level, request))
+                      .select_related('user')
+                      .order_by('-updated_at')[:20])
             feed_objects.extend(recent)
 
         feed_objects = sorted(feed_objects, key=lambda x: x.updated_at, reverse=True)
@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'app.middleware.VisiblePksCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -104,6 +105,11 @@ DATABASES = {
     'default': database_config 
 }
 
+# Iterative scans (pgvector 0.8+) keep walking the HNSW index until filtered similarity
+# searches have enough rows, instead of stopping after ef_search candidates. Passed as a
+# connection startup option so that it costs no extra query per connection.
+database_config.setdefault('OPTIONS', {})['options'] = '-c hnsw.iterative_scan=strict_order'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators